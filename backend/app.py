@@ -1,5 +1,16 @@
 import os
 import sys
+import json
+import random
+import re
+import threading
+import uuid
+import contextvars
+import hashlib
+import asyncio
+import math
+import base64
+import importlib.util
 import torch
 from torchvision import transforms
 from PIL import Image
@@ -11,10 +22,14 @@ import calendar
 from collections import Counter
 import firebase_admin
 from firebase_admin import credentials, firestore
-from fastapi import FastAPI, UploadFile, File, Query, HTTPException
+from fastapi import FastAPI, UploadFile, File, Query, Path, HTTPException, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import tempfile
 import time
 from fastapi.middleware.cors import CORSMiddleware
+from export_records import EXPORT_FIELDS, iter_record_chunks, csv_chunks, parquet_chunks, parse_date
+from time_buckets import get_timezone, timezone_name, time_bucket
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +39,41 @@ OPENROUTER_KEY = os.getenv("OPENROUTER_KEY")
 OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
 FIREBASE_CREDENTIALS_PATH = os.getenv("FIREBASE_CREDENTIALS_PATH")
 FIREBASE_COLLECTION = os.getenv("FIREBASE_COLLECTION", "waste_records")
+# Facility timezone (IANA name) used for the stored time buckets and analytics
+TIMEZONE = os.getenv("TIMEZONE", "UTC")
+FACILITY_TZ = get_timezone(TIMEZONE)
+
+# Profiling (all off by default)
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_KEEP = int(os.getenv("PROFILE_MAX_KEEP", "50"))
+
+# Model cascade (disabled unless CASCADE_MODEL_PATH is set)
+CASCADE_MODEL_PATH = os.getenv("CASCADE_MODEL_PATH")
+CASCADE_MODEL_ARCH = os.getenv("CASCADE_MODEL_ARCH", "efficientnet_b0")
+CASCADE_IMAGE_SIZE = int(os.getenv("CASCADE_IMAGE_SIZE", "224"))
+CASCADE_THRESHOLD = float(os.getenv("CASCADE_THRESHOLD", "0.85"))
+CASCADE_AUDIT_RATE = float(os.getenv("CASCADE_AUDIT_RATE", "0.05"))
+
+# Admission control for the classification endpoint
+CLASSIFY_MAX_IN_FLIGHT = int(os.getenv("CLASSIFY_MAX_IN_FLIGHT", "2"))
+CLASSIFY_MAX_QUEUE = int(os.getenv("CLASSIFY_MAX_QUEUE", "8"))
+CLASSIFY_MAX_UPLOAD_MB = float(os.getenv("CLASSIFY_MAX_UPLOAD_MB", "10"))
+# Requests whose body may be read at the same time (uploading or past it)
+CLASSIFY_MAX_UPLOADS = int(os.getenv("CLASSIFY_MAX_UPLOADS", "16"))
+# Matches the frontend's axios timeout; clients can send X-Request-Timeout (seconds)
+CLASSIFY_DEADLINE_S = float(os.getenv("CLASSIFY_DEADLINE_S", "60"))
+
+# Analytics response cache. Writes from this app invalidate it immediately;
+# the TTL bounds staleness for records written by other scripts.
+ANALYTICS_CACHE_TTL_S = float(os.getenv("ANALYTICS_CACHE_TTL_S", "300"))
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "256"))
+
+# Records read per Firestore query (and per Parquet row group) when exporting
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
 
 # Firebase Initialization
 try:
@@ -142,6 +192,18 @@ except Exception as e:
     print(f"❌ Error loading model: {e}")
     sys.exit(1)
 
+# Load first-stage cascade model (optional, falls back to the full model only)
+first_stage_model = None
+if CASCADE_MODEL_PATH:
+    try:
+        first_stage_model = timm.create_model(CASCADE_MODEL_ARCH, pretrained=False, num_classes=len(classes))
+        first_stage_model.load_state_dict(torch.load(CASCADE_MODEL_PATH, map_location=device))
+        first_stage_model.to(device).eval()
+        print(f"✅ Cascade model ({CASCADE_MODEL_ARCH}) loaded, threshold {CASCADE_THRESHOLD}.")
+    except Exception as e:
+        print(f"⚠️ Cascade disabled, error loading first-stage model: {e}")
+        first_stage_model = None
+
 # Image Transform
 transform = transforms.Compose([
     transforms.Resize((300, 300)),
@@ -149,21 +211,217 @@ transform = transforms.Compose([
     transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
 ])
 
+first_stage_transform = transforms.Compose([
+    transforms.Resize((CASCADE_IMAGE_SIZE, CASCADE_IMAGE_SIZE)),
+    transforms.ToTensor(),
+    transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+])
+
+# Cascade statistics. Audits run the full model on a sample of first-stage
+# answers so the accuracy cost of the cascade can be estimated against B3.
+cascade_stats = {
+    "predictions": 0,
+    "first_stage_hits": 0,
+    "fallbacks": 0,
+    "audited": 0,
+    "audit_disagreements": 0
+}
+cascade_lock = threading.Lock()
+
+def cascade_report():
+    with cascade_lock:
+        stats = dict(cascade_stats)
+    hit_rate = stats["first_stage_hits"] / stats["predictions"] if stats["predictions"] else 0
+    # Audited hits were answered by B3, so only unaudited hits can differ from it
+    served_rate = (stats["first_stage_hits"] - stats["audited"]) / stats["predictions"] if stats["predictions"] else 0
+    disagreement_rate = stats["audit_disagreements"] / stats["audited"] if stats["audited"] else None
+    return {
+        "enabled": first_stage_model is not None,
+        "first_stage_model": CASCADE_MODEL_ARCH if first_stage_model is not None else None,
+        "threshold": CASCADE_THRESHOLD,
+        **stats,
+        "hit_rate": round(hit_rate, 4),
+        "audit_agreement": round(1 - disagreement_rate, 4) if disagreement_rate is not None else None,
+        # Share of all answers expected to differ from what B3 alone would return
+        "estimated_accuracy_delta": round(-served_rate * disagreement_rate, 4) if disagreement_rate is not None else None
+    }
+
+# Request Profiling
+# Profile of the request currently being handled; only set when operator-level
+# torch profiling is wanted (header or sampled requests)
+current_profile = contextvars.ContextVar("current_profile", default=None)
+# Stack samples of the request currently being handled (None when not profiling)
+current_samples = contextvars.ContextVar("current_samples", default=None)
+PROFILE_ID_RE = re.compile(r"^[0-9A-Za-z_-]+$")
+
+class StackSampler:
+    """Samples the call stacks of registered threads at a fixed interval.
+
+    One sampler is shared by the whole process. run_blocking registers the
+    worker thread doing a profiled request's blocking work together with that
+    request's sample Counter, so samples are never mixed between requests
+    (unlike the event loop thread, which all requests share). Samples are kept
+    in collapsed-stack format ("outer;inner;leaf count"), which flamegraph.pl
+    and speedscope can load directly.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.threads = {}  # thread id -> sample Counter of the request running on it
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def attach(self, thread_id, samples):
+        with self._changed:
+            self.threads[thread_id] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def detach(self, thread_id):
+        with self._changed:
+            self.threads.pop(thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                # Sleep until something is attached instead of polling an empty registry
+                while not self.threads:
+                    self._changed.wait()
+            time.sleep(self.interval)
+            # Frames are taken and recorded under the lock, so a thread cannot detach
+            # and start other work in between and have that work credited here
+            with self._changed:
+                frames = sys._current_frames()
+                for thread_id, samples in self.threads.items():
+                    frame = frames.get(thread_id)
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    if stack:
+                        samples[";".join(reversed(stack))] += 1
+
+stack_sampler = StackSampler(PROFILE_INTERVAL_MS / 1000)
+
+def collapsed_stacks(samples):
+    return [f"{stack} {count}" for stack, count in samples.most_common()]
+
+async def run_blocking(func, *args):
+    """Runs blocking work in the threadpool, sampling its stacks if the request is profiled."""
+    def call():
+        samples = current_samples.get()
+        if samples is None:
+            return func(*args)
+        thread_id = threading.get_ident()
+        stack_sampler.attach(thread_id, samples)
+        try:
+            return func(*args)
+        finally:
+            stack_sampler.detach(thread_id)
+    return await run_in_threadpool(contextvars.copy_context().run, call)
+
+def profile_trigger(request):
+    """Returns why this request should be profiled, or None."""
+    if request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes"):
+        return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    if PROFILE_SLOW_MS > 0:
+        # Latency is only known afterwards, so sample stacks and keep them if slow
+        return "slow"
+    return None
+
+def profile_files():
+    """Stored profile paths, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            files.append((os.path.getmtime(path), path))
+        except OSError:
+            continue  # deleted by a concurrent save_profile cleanup
+    return [path for _, path in sorted(files, reverse=True)]
+
+def save_profile(profile):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{profile['id']}.json")
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+
+    # Keep only the most recent profiles
+    for old in profile_files()[PROFILE_MAX_KEEP:]:
+        try:
+            os.unlink(old)
+        except OSError:
+            pass
+
+def list_profiles(limit):
+    profiles = []
+    for path in profile_files()[:limit]:
+        try:
+            with open(path) as f:
+                profile = json.load(f)
+        except (OSError, ValueError):
+            continue
+        profiles.append({k: v for k, v in profile.items() if k not in ("stacks", "torch_ops")})
+    return profiles
+
 # Prediction function
-def predict_image(image_path):
-    img = Image.open(image_path).convert("RGB")
-    img_t = transform(img).unsqueeze(0).to(device)
+def model_probs(net, img_t, stage):
+    profile = current_profile.get()
     with torch.no_grad():
-        outputs = model(img_t)
-        probs = torch.softmax(outputs, dim=1)
-        conf, idx = torch.max(probs, dim=1)
-        confidence = float(conf.item())
-        cls_name = classes[idx.item()]
+        if profile is not None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if device.type == "cuda":
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            with torch.profiler.profile(activities=activities) as prof:
+                outputs = net(img_t)
+            sort_by = "self_cuda_time_total" if device.type == "cuda" else "self_cpu_time_total"
+            profile.setdefault("torch_ops", {})[stage] = prof.key_averages().table(sort_by=sort_by, row_limit=30)
+        else:
+            outputs = net(img_t)
+        return torch.softmax(outputs, dim=1)
 
+def prediction_result(idx, confidence):
+    cls_name = classes[idx]
     category = category_map.get(cls_name, "Unknown")
     disposal_info = disposal_map.get(category, {"technique": "Unknown", "steps": []})
     return cls_name, category, disposal_info["technique"], disposal_info["steps"], confidence
 
+def predict_image(image_path):
+    img = Image.open(image_path).convert("RGB")
+
+    # 1️⃣ Cheap first stage answers when it is confident enough
+    first_hit = False
+    if first_stage_model is not None:
+        probs = model_probs(first_stage_model, first_stage_transform(img).unsqueeze(0).to(device), "first_stage")
+        conf, idx = torch.max(probs, dim=1)
+        first_idx, first_conf = idx.item(), float(conf.item())
+        first_hit = first_conf >= CASCADE_THRESHOLD
+        audit = first_hit and random.random() < CASCADE_AUDIT_RATE
+        with cascade_lock:
+            cascade_stats["predictions"] += 1
+            cascade_stats["first_stage_hits" if first_hit else "fallbacks"] += 1
+        if first_hit and not audit:
+            return prediction_result(first_idx, first_conf)
+
+    # 2️⃣ Full EfficientNet-B3 for low-confidence (or audited) images
+    probs = model_probs(model, transform(img).unsqueeze(0).to(device), "full")
+    conf, idx = torch.max(probs, dim=1)
+    if first_hit:
+        with cascade_lock:
+            cascade_stats["audited"] += 1
+            if idx.item() != first_idx:
+                cascade_stats["audit_disagreements"] += 1
+    return prediction_result(idx.item(), float(conf.item()))
+
 # LLM Reusability Analysis
 def analyze_reusability(description):
     if not OPENROUTER_KEY:
@@ -191,30 +449,325 @@ Include: Reusable (T/F), Repurposable (T/F), Recovery Method, Possible New Use,
     except Exception as e:
         return f"❌ LLM request failed: {e}"
 
-# Fetch all records from Firebase
-def fetch_all_records():
+class RecordsUnavailable(Exception):
+    """Firestore could not be read; callers must not mistake this for an empty collection."""
+    pass
+
+# Count records in Firebase, grouped by one field
+def count_by(field, **filters):
+    """Counter of `field` values over records matching equality filters.
+
+    Only `field` is read from each document. Filters on the stored bucket_*
+    keys (a list value means "in") are pushed down to Firestore and also pin
+    bucket_tz to the facility timezone, so records written under another
+    TIMEZONE, or not yet backfilled by time_buckets.py, are left out.
+    """
     if not db:
         print("❌ No Firebase connection")
-        return []
+        raise RecordsUnavailable("No Firebase connection.")
+    if filters:
+        filters["bucket_tz"] = timezone_name(FACILITY_TZ)
     try:
-        records = db.collection(FIREBASE_COLLECTION).stream()
-        data = []
-        for record in records:
-            rec = record.to_dict()
-            # Parse timestamp_utc to datetime
-            try:
-                rec['datetime'] = datetime.fromisoformat(rec['timestamp_utc'].replace('Z', '+00:00'))
-            except (KeyError, ValueError):
-                rec['datetime'] = None
-            data.append(rec)
-        print(f"✅ Fetched {len(data)} records from Firebase")
-        return data
+        query = db.collection(FIREBASE_COLLECTION)
+        for key, value in filters.items():
+            query = query.where(key, "in" if isinstance(value, list) else "==", value)
+        counts = Counter((snapshot.to_dict() or {}).get(field) for snapshot in query.select([field]).stream())
+        print(f"✅ Counted {sum(counts.values())} records by {field} from Firebase")
+        return counts
     except Exception as e:
         print(f"❌ Error fetching records: {e}")
-        return []
+        raise RecordsUnavailable(f"Error fetching records: {e}")
+
+# Paginated record listing
+record_fields = EXPORT_FIELDS
+# Default projection leaves out the long free-text fields
+default_record_fields = [
+    "class_name", "category", "disposal_technique", "container_color",
+    "suggested_color", "timestamp_utc", "confidence"
+]
+
+def encode_cursor(timestamp_utc, doc_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp_utc, doc_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp_utc, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp_utc), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+def parse_time_param(value, name, end=False):
+    """Parses a date or datetime query parameter into a UTC ISO string bound.
+
+    Values without a UTC offset are taken to be in the facility timezone.
+    """
+    if not value:
+        return None
+    try:
+        # A bare end date includes that whole day
+        return parse_date(value, end=end, tz=FACILITY_TZ)
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: {value}")
+
+def parse_fields_param(fields):
+    if not fields:
+        return list(default_record_fields)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in record_fields]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+def query_records(start=None, end=None, filters=None, fields=None, cursor=None, limit=50):
+    """Fetches one page of records, newest first, using keyset pagination.
+
+    `start`/`end` are UTC ISO strings (end exclusive), `filters` maps field
+    names to required values and `cursor` is a (timestamp_utc, doc_id) pair
+    from the previous page. Returns (records, next_cursor).
+    """
+    if not db:
+        print("❌ No Firebase connection")
+        raise HTTPException(status_code=503, detail="No Firebase connection.", headers={"Retry-After": "5"})
+    collection = db.collection(FIREBASE_COLLECTION)
+    query = collection
+    for field, value in (filters or {}).items():
+        if value is not None:
+            query = query.where(field, "==", value)
+    if start:
+        query = query.where("timestamp_utc", ">=", start)
+    if end:
+        query = query.where("timestamp_utc", "<", end)
+    # Document id breaks ties between records with the same timestamp
+    query = query.order_by("timestamp_utc", direction=firestore.Query.DESCENDING)
+    query = query.order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+    if fields:
+        query = query.select(sorted(set(fields) | {"timestamp_utc"}))
+    if cursor:
+        timestamp_utc, doc_id = cursor
+        query = query.start_after({"timestamp_utc": timestamp_utc, "__name__": collection.document(doc_id)})
+
+    records = []
+    last = None
+    for snapshot in query.limit(limit + 1).stream():
+        if len(records) == limit:
+            return records, encode_cursor(*last)
+        rec = snapshot.to_dict()
+        last = (rec.get("timestamp_utc"), snapshot.id)
+        if fields and "timestamp_utc" not in fields:
+            rec.pop("timestamp_utc", None)
+        records.append({"id": snapshot.id, **rec})
+    return records, None
+
+# Analytics Cache
+# Bumped on every record write; cached analytics from older versions are discarded
+data_version = 0
+analytics_cache = {}
+
+def bump_data_version():
+    global data_version
+    data_version += 1
+    analytics_cache.clear()
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+async def cached_analytics(request, compute, *args):
+    """Serves compute(*args) from cache for this path and query, with ETag revalidation."""
+    key = (request.url.path, tuple(sorted(request.query_params.multi_items())))
+    entry = analytics_cache.get(key)
+    if entry is None or entry["version"] != data_version or time.time() - entry["computed_at"] > ANALYTICS_CACHE_TTL_S:
+        version = data_version
+        try:
+            result = await run_blocking(compute, *args)
+        except RecordsUnavailable as e:
+            # Never cache (or ETag) a failed read, it would look like zero records
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+        body = JSONResponse(result).body
+        entry = {
+            "version": version,
+            "computed_at": time.time(),
+            "body": body,
+            "etag": f'"{hashlib.sha1(body).hexdigest()}"'
+        }
+        # Don't cache a result that a concurrent write has already made stale
+        if version == data_version:
+            analytics_cache.pop(key, None)
+            if len(analytics_cache) >= ANALYTICS_CACHE_MAX_ENTRIES:
+                analytics_cache.pop(next(iter(analytics_cache)))
+            analytics_cache[key] = entry
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+# Admission Control
+class ClassifyAdmission:
+    """Bounded in-flight/queue budget around the CPU stage (model inference) of a request.
+
+    Only predict_image holds a slot, so slow uploads, the LLM call and the
+    Firestore write never keep the model idle. Requests are shed with 503 +
+    Retry-After when the queue is full or when the expected wait means the
+    client will have timed out before an answer is ready.
+    """
+
+    def __init__(self, max_in_flight, max_queue):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.service_time = 0.0  # moving average of seconds per inference
+        self.slots = None
+
+    def expected_wait(self):
+        ahead = self.in_flight + self.waiting - self.max_in_flight
+        if ahead < 0:
+            return 0.0
+        return math.ceil((ahead + 1) / self.max_in_flight) * self.service_time
+
+    def shed_reason(self, deadline):
+        """Returns (detail, retry_after) if a request with this deadline should be shed now."""
+        wait = self.expected_wait()
+        if self.in_flight + self.waiting >= self.max_in_flight + self.max_queue:
+            return "Server busy, classification queue is full.", wait
+        if time.monotonic() + wait + self.service_time > deadline:
+            return "Server busy, request would not finish before its deadline.", wait
+        return None
+
+    async def run(self, deadline, func, *args):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_in_flight)
+        shed = self.shed_reason(deadline)
+        if shed:
+            raise overloaded(*shed)
+
+        # Wait for a slot, but never past the point where the answer could still be used
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.slots.acquire(), timeout=max(0.0, deadline - self.service_time - time.monotonic()))
+        except asyncio.TimeoutError:
+            raise overloaded("Server busy, request dropped after waiting past its deadline.", self.expected_wait())
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        start = time.monotonic()
+        try:
+            return await run_blocking(func, *args)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+            elapsed = time.monotonic() - start
+            self.service_time = elapsed if self.service_time == 0 else 0.8 * self.service_time + 0.2 * elapsed
+
+def overloaded(detail, retry_after):
+    print(f"⚠️ Shedding classification request: {detail}")
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+classify_admission = ClassifyAdmission(CLASSIFY_MAX_IN_FLIGHT, CLASSIFY_MAX_QUEUE)
+
+class UploadTooLarge(Exception):
+    pass
+
+class AdmissionControlMiddleware:
+    """Front door for the classification endpoint.
+
+    Sheds requests before their body is read when admission would refuse them
+    anyway or when max_uploads requests are already reading theirs, records
+    the client's deadline in the request state, and counts upload bytes as
+    the body streams in so an oversized file is refused with 413 without
+    being buffered first. No inference slot is held here.
+    """
+
+    def __init__(self, app, path, admission, max_uploads, max_upload_bytes, deadline_s):
+        self.app = app
+        self.path = path
+        self.admission = admission
+        self.max_uploads = max_uploads
+        self.max_upload_bytes = max_upload_bytes
+        self.deadline_s = deadline_s
+        self.uploads = 0  # requests admitted past the front door and not yet answered
+
+    async def reject(self, scope, receive, send, status_code, detail, retry_after=None):
+        headers = {"Retry-After": str(max(1, math.ceil(retry_after)))} if retry_after is not None else None
+        print(f"⚠️ Rejected {scope['path']} with {status_code}: {detail}")
+        response = JSONResponse({"detail": detail}, status_code=status_code, headers=headers)
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] != self.path:
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        try:
+            content_length = int(headers.get("content-length", 0))
+        except ValueError:
+            content_length = 0
+        if content_length > self.max_upload_bytes:
+            return await self.reject(scope, receive, send, 413, f"Upload exceeds {self.max_upload_bytes} bytes.")
+
+        arrival = time.monotonic()
+        try:
+            timeout = float(headers.get("x-request-timeout", self.deadline_s))
+        except ValueError:
+            timeout = self.deadline_s
+        if not math.isfinite(timeout) or timeout <= 0:
+            timeout = self.deadline_s
+        deadline = arrival + timeout
+        scope.setdefault("state", {})["deadline"] = deadline
+
+        # Fail fast, before the upload is read, when the request would be shed anyway
+        shed = self.admission.shed_reason(deadline)
+        if shed:
+            return await self.reject(scope, receive, send, 503, *shed)
+        if self.uploads >= self.max_uploads:
+            retry_after = self.admission.expected_wait() + self.admission.service_time
+            return await self.reject(scope, receive, send, 503, "Server busy, too many uploads in progress.", retry_after)
+
+        state = {"received": 0, "too_large": False, "started": False}
+
+        async def receive_limited():
+            message = await receive()
+            if message["type"] == "http.request":
+                state["received"] += len(message.get("body", b""))
+                if state["received"] > self.max_upload_bytes:
+                    state["too_large"] = True
+                    raise UploadTooLarge()
+            return message
+
+        async def send_tracked(message):
+            if state["too_large"]:
+                return  # drop the app's own error response, 413 is sent below
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            await send(message)
+
+        self.uploads += 1
+        try:
+            await self.app(scope, receive_limited, send_tracked)
+        except UploadTooLarge:
+            pass
+        finally:
+            self.uploads -= 1
+        if state["too_large"] and not state["started"]:
+            await self.reject(scope, receive, send, 413, f"Upload exceeds {self.max_upload_bytes} bytes.")
 
 # FastAPI App
 app = FastAPI()
+# Added before CORS so rejections still carry CORS headers
+app.add_middleware(
+    AdmissionControlMiddleware,
+    path="/api/classify-medical-waste",
+    admission=classify_admission,
+    max_uploads=CLASSIFY_MAX_UPLOADS,
+    max_upload_bytes=int(CLASSIFY_MAX_UPLOAD_MB * 1024 * 1024),
+    deadline_s=CLASSIFY_DEADLINE_S
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
@@ -223,16 +776,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    if not request.url.path.startswith("/api/") or request.url.path.startswith("/api/profiles"):
+        return await call_next(request)
+    trigger = profile_trigger(request)
+    if trigger is None:
+        return await call_next(request)
+
+    profile = {
+        "id": f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}",
+        "trigger": trigger,
+        "method": request.method,
+        "path": request.url.path,
+        "query": request.url.query,
+        "client": request.client.host if request.client else None,
+        "timestamp_utc": datetime.now(timezone.utc).isoformat()
+    }
+    # Slow-request capture runs on all traffic, so it only takes the shared stack
+    # sampler; the torch operator profiler is reserved for header/sampled requests
+    samples = Counter()
+    token = current_profile.set(profile if trigger != "slow" else None)
+    samples_token = current_samples.set(samples)
+    start_time = time.time()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        current_profile.reset(token)
+        current_samples.reset(samples_token)
+        duration_ms = (time.time() - start_time) * 1000
+        if trigger != "slow" or duration_ms >= PROFILE_SLOW_MS:
+            profile.update({
+                "status_code": status_code,
+                "duration_ms": round(duration_ms, 1),
+                "samples": sum(samples.values()),
+                "stacks": collapsed_stacks(samples)
+            })
+            profile.setdefault("torch_ops", None)
+            try:
+                await run_in_threadpool(save_profile, profile)
+                print(f"📈 Profile {profile['id']} saved ({trigger}, {duration_ms:.0f} ms)")
+            except Exception as e:
+                print(f"❌ Error saving profile: {e}")
+
+@app.get("/api/profiles")
+async def get_profiles(limit: int = Query(default=20, ge=1, le=200)):
+    return await run_in_threadpool(list_profiles, limit)
+
+@app.get("/api/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.json")
+    if not PROFILE_ID_RE.match(profile_id) or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail=f"Profile not found: {profile_id}")
+    return FileResponse(path, media_type="application/json", filename=f"{profile_id}.json")
+
+@app.get("/api/cascade/stats")
+async def get_cascade_stats():
+    return cascade_report()
+
 @app.post("/api/classify-medical-waste")
-async def classify_medical_waste(file: UploadFile = File(...), container_color: str = Query('red')):
+async def classify_medical_waste(request: Request, file: UploadFile = File(...), container_color: str = Query('red')):
     start_time = time.time()
+    deadline = getattr(request.state, "deadline", time.monotonic() + CLASSIFY_DEADLINE_S)
     try:
         with tempfile.NamedTemporaryFile(delete=False) as tmp:
             tmp.write(await file.read())
             image_path = tmp.name
 
-        cls_name, category, technique, steps, confidence = predict_image(image_path)
-        os.unlink(image_path)
+        try:
+            cls_name, category, technique, steps, confidence = await classify_admission.run(deadline, predict_image, image_path)
+        finally:
+            os.unlink(image_path)
         print(f"Prediction Time: {time.time() - start_time:.2f} seconds")
     
         # 1️⃣ Confidence Threshold Check
@@ -268,11 +885,12 @@ async def classify_medical_waste(file: UploadFile = File(...), container_color:
         # 3️⃣ Proceed Normally for Valid Predictions
         description = f"{cls_name} ({category}), confidence {confidence:.2f}"
         llm_start = time.time()
-        llm_result = analyze_reusability(description)
+        llm_result = await run_blocking(analyze_reusability, description)
         print(f"LLM Time: {time.time() - llm_start:.2f} seconds")
 
         suggested_color = color_map.get(category, "black")
-        timestamp_utc = datetime.now(timezone.utc).isoformat()
+        now = datetime.now(timezone.utc)
+        timestamp_utc = now.isoformat()
 
         response = {
             "class_name": cls_name,
@@ -290,7 +908,8 @@ async def classify_medical_waste(file: UploadFile = File(...), container_color:
         if db:
             try:
                 doc_ref = db.collection(FIREBASE_COLLECTION).document()
-                doc_ref.set(response)
+                await run_blocking(doc_ref.set, {**response, **time_bucket(now, FACILITY_TZ)})
+                bump_data_version()
                 print(f"✅ Metadata stored in Firebase with ID: {doc_ref.id}")
             except Exception as e:
                 print(f"❌ Error storing metadata: {e}")
@@ -298,15 +917,18 @@ async def classify_medical_waste(file: UploadFile = File(...), container_color:
         print(f"Total Time: {time.time() - start_time:.2f} seconds")
         return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error in classify_medical_waste: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/analytics/summary")
-async def get_summary():
-    records = fetch_all_records()
-    total = len(records)
+# Analytics computations (wrapped by the cached endpoints below)
+# Records are grouped by their stored facility-local bucket_* keys
+def summary_analytics():
+    class_counts = count_by("class_name")
+    total = sum(class_counts.values())
     if total == 0:
         return {
             "total_classifications": 0,
@@ -314,19 +936,14 @@ async def get_summary():
             "monthly_percentages": {calendar.month_name[m]: 0 for m in range(1, 13)}
         }
 
-    class_counts = Counter(r['class_name'] for r in records if r.get('class_name'))
+    class_counts.pop(None, None)
     most_common = class_counts.most_common(1)[0][0] if class_counts else "N/A"
 
     # Calculate monthly percentages for the current year
-    current_year = datetime.now().year
-    monthly_counts = {m: 0 for m in range(1, 13)}
-    for r in records:
-        dt = r.get('datetime')
-        if dt and dt.year == current_year:
-            monthly_counts[dt.month] += 1
+    monthly_counts = count_by("bucket_month", bucket_year=datetime.now(FACILITY_TZ).year)
     monthly_percentages = {
-        calendar.month_name[m]: round((count / total * 100), 1) if total > 0 else 0
-        for m, count in monthly_counts.items()
+        calendar.month_name[m]: round((monthly_counts[m] / total * 100), 1) if total > 0 else 0
+        for m in range(1, 13)
     }
 
     return {
@@ -335,43 +952,32 @@ async def get_summary():
         "monthly_percentages": monthly_percentages
     }
 
-@app.get("/api/analytics/yearly")
-async def get_yearly(years: int = Query(default=5, ge=1, le=10)):
-    records = fetch_all_records()
-    current_year = datetime.now().year
-    yearly = {}
-    for y in range(current_year - years + 1, current_year + 1):
-        count = sum(1 for r in records if r.get('datetime') and r['datetime'].year == y)
-        yearly[y] = count
-    return [[year, count] for year, count in sorted(yearly.items())]
+def yearly_analytics(years):
+    current_year = datetime.now(FACILITY_TZ).year
+    year_range = list(range(current_year - years + 1, current_year + 1))
+    year_counts = count_by("bucket_year", bucket_year=year_range)
+    return [[y, year_counts[y]] for y in year_range]
 
-@app.get("/api/analytics/monthly/{year}")
-async def get_monthly(year: int):
-    records = fetch_all_records()
-    monthly = {m: 0 for m in range(1, 13)}
-    for r in records:
-        dt = r.get('datetime')
-        if dt and dt.year == year:
-            monthly[dt.month] += 1
-    return [{"month": calendar.month_name[m], "classifications": count} for m, count in sorted(monthly.items())]
+def monthly_analytics(year):
+    monthly = count_by("bucket_month", bucket_year=year)
+    return [{"month": calendar.month_name[m], "classifications": monthly[m]} for m in range(1, 13)]
 
-@app.get("/api/analytics/color-breakdown/{year}/{month}")
-async def get_color_breakdown(year: int, month: str):
-    month = month.capitalize()  # Normalize month name
-    try:
-        month_num = list(calendar.month_name).index(month)
-    except ValueError:
-        raise HTTPException(status_code=400, detail=f"Invalid month: {month}")
-    
-    records = fetch_all_records()
-    color_counts = {"red": 0, "blue": 0, "yellow": 0, "black": 0}
-    total = 0
-    for r in records:
-        dt = r.get('datetime')
-        color = r.get('container_color')
-        if dt and dt.year == year and dt.month == month_num and color in color_counts:
-            color_counts[color] += 1
-            total += 1
+def daily_analytics(year, month_num):
+    daily = count_by("bucket_day", bucket_year=year, bucket_month=month_num)
+    days = [f"{year:04d}-{month_num:02d}-{d:02d}" for d in range(1, calendar.monthrange(year, month_num)[1] + 1)]
+    return [{"day": day, "classifications": daily[day]} for day in days]
+
+def hourly_analytics(year, month_num, day=None):
+    if day:
+        hourly = count_by("bucket_hour", bucket_day=f"{year:04d}-{month_num:02d}-{day:02d}")
+    else:
+        hourly = count_by("bucket_hour", bucket_year=year, bucket_month=month_num)
+    return [{"hour": h, "classifications": hourly[h]} for h in range(24)]
+
+def color_breakdown_analytics(year, month_num):
+    stored_colors = count_by("container_color", bucket_year=year, bucket_month=month_num)
+    color_counts = {color: stored_colors[color] for color in ("red", "blue", "yellow", "black")}
+    total = sum(color_counts.values())
 
     breakdown = []
     for color, count in color_counts.items():
@@ -384,23 +990,10 @@ async def get_color_breakdown(year: int, month: str):
         })
     return breakdown
 
-@app.get("/api/analytics/class-breakdown/{year}/{month}")
-async def get_class_breakdown(year: int, month: str):
-    month = month.capitalize()  # Normalize month name
-    try:
-        month_num = list(calendar.month_name).index(month)
-    except ValueError:
-        raise HTTPException(status_code=400, detail=f"Invalid month: {month}")
-    
-    records = fetch_all_records()
-    class_counts = {}
-    total = 0
-    for r in records:
-        dt = r.get('datetime')
-        cls = r.get('class_name')
-        if dt and dt.year == year and dt.month == month_num and cls:
-            class_counts[cls] = class_counts.get(cls, 0) + 1
-            total += 1
+def class_breakdown_analytics(year, month_num):
+    class_counts = count_by("class_name", bucket_year=year, bucket_month=month_num)
+    class_counts.pop(None, None)
+    total = sum(class_counts.values())
 
     breakdown = []
     for cls, count in class_counts.items():
@@ -413,6 +1006,106 @@ async def get_class_breakdown(year: int, month: str):
     # Return top 5 classes sorted by percentage
     return sorted(breakdown, key=lambda x: x['percentage'], reverse=True)[:5]
 
+def parse_month(month):
+    month = month.capitalize()  # Normalize month name
+    try:
+        return list(calendar.month_name).index(month)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid month: {month}")
+
+@app.get("/api/analytics/summary")
+async def get_summary(request: Request):
+    return await cached_analytics(request, summary_analytics)
+
+@app.get("/api/analytics/yearly")
+async def get_yearly(request: Request, years: int = Query(default=5, ge=1, le=10)):
+    return await cached_analytics(request, yearly_analytics, years)
+
+@app.get("/api/analytics/monthly/{year}")
+async def get_monthly(request: Request, year: int):
+    return await cached_analytics(request, monthly_analytics, year)
+
+@app.get("/api/analytics/daily/{year}/{month}")
+async def get_daily(request: Request, month: str, year: int = Path(ge=1, le=9999)):
+    month_num = parse_month(month)
+    return await cached_analytics(request, daily_analytics, year, month_num)
+
+@app.get("/api/analytics/hourly/{year}/{month}")
+async def get_hourly(request: Request, month: str, year: int = Path(ge=1, le=9999), day: int = Query(default=None, ge=1, le=31)):
+    month_num = parse_month(month)
+    if day and day > calendar.monthrange(year, month_num)[1]:
+        raise HTTPException(status_code=400, detail=f"Invalid day: {day}")
+    return await cached_analytics(request, hourly_analytics, year, month_num, day)
+
+@app.get("/api/analytics/color-breakdown/{year}/{month}")
+async def get_color_breakdown(request: Request, year: int, month: str):
+    month_num = parse_month(month)
+    return await cached_analytics(request, color_breakdown_analytics, year, month_num)
+
+@app.get("/api/analytics/class-breakdown/{year}/{month}")
+async def get_class_breakdown(request: Request, year: int, month: str):
+    month_num = parse_month(month)
+    return await cached_analytics(request, class_breakdown_analytics, year, month_num)
+
+@app.get("/api/waste-records")
+async def get_waste_records(
+    start: str = Query(default=None, description="Earliest date/datetime (inclusive)"),
+    end: str = Query(default=None, description="Latest date/datetime (a bare date includes the whole day)"),
+    class_name: str = Query(default=None),
+    category: str = Query(default=None),
+    container_color: str = Query(default=None),
+    fields: str = Query(default=None, description="Comma-separated fields to return"),
+    cursor: str = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200)
+):
+    filters = {
+        "class_name": class_name,
+        "category": category,
+        "container_color": container_color.lower() if container_color else None
+    }
+    records, next_cursor = await run_blocking(
+        query_records,
+        parse_time_param(start, "start"),
+        parse_time_param(end, "end", end=True),
+        filters,
+        parse_fields_param(fields),
+        decode_cursor(cursor) if cursor else None,
+        limit
+    )
+    return {"records": records, "next_cursor": next_cursor}
+
+@app.get("/api/waste-records/export")
+async def export_waste_records(
+    export_format: str = Query(default="csv", alias="format", description="csv or parquet"),
+    start: str = Query(default=None, description="Earliest date/datetime (inclusive)"),
+    end: str = Query(default=None, description="Latest date/datetime (a bare date includes the whole day)"),
+    fields: str = Query(default=None, description="Comma-separated columns (default: all)")
+):
+    export_format = export_format.lower()
+    if export_format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail=f"Invalid format: {export_format}")
+    if not db:
+        raise HTTPException(status_code=503, detail="No Firebase connection.")
+    if export_format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow.")
+
+    columns = parse_fields_param(fields) if fields else list(record_fields)
+    record_chunks = iter_record_chunks(
+        db,
+        FIREBASE_COLLECTION,
+        parse_time_param(start, "start"),
+        parse_time_param(end, "end", end=True),
+        columns,
+        EXPORT_CHUNK_SIZE
+    )
+    # Sync generators are iterated in the threadpool, so Firestore reads don't block the event loop
+    if export_format == "csv":
+        body, media_type = csv_chunks(record_chunks, columns), "text/csv"
+    else:
+        body, media_type = parquet_chunks(record_chunks, columns), "application/vnd.apache.parquet"
+    filename = f"waste_records_{datetime.now(timezone.utc).strftime('%Y%m%d')}.{export_format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -7,6 +7,7 @@ from datetime import datetime, timezone
 import firebase_admin
 from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
+from time_buckets import get_timezone, time_bucket
 
 # ------------------------
 # Suppress gRPC / ALTS warnings
@@ -182,13 +183,15 @@ if __name__ == "__main__":
     
     # Store in Firebase
     try:
+        now = datetime.now(timezone.utc)
         doc_ref = db.collection(FIREBASE_COLLECTION).document()
         doc_ref.set({
             "class_name": cls_name,
             "category": category,
             "disposal_technique": technique,
             "disposal_steps": steps,
-            "timestamp_utc": datetime.now(timezone.utc).isoformat()
+            "timestamp_utc": now.isoformat(),
+            **time_bucket(now, get_timezone(TIMEZONE))
         })
         print(f"✅ Metadata stored successfully in Firebase with ID: {doc_ref.id}")
     except Exception as e:
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Streaming export of waste records to CSV or Parquet.
+
+Records are read from Firestore in fixed-size chunks and written out chunk by
+chunk (one Parquet row group per chunk), so memory use does not depend on the
+size of the collection. The API's /api/waste-records/export endpoint uses the
+same helpers.
+
+Usage:
+    python export_records.py --format csv --output records.csv
+    python export_records.py --format parquet --start 2025-01-01 --end 2025-12-31 \
+        --fields class_name,category,timestamp_utc --output 2025.parquet
+"""
+
+import argparse
+import csv
+import io
+import os
+import sys
+from datetime import datetime, timezone, timedelta
+
+from firebase_admin import firestore
+
+EXPORT_FIELDS = [
+    "class_name", "category", "category_description", "disposal_technique", "disposal_steps",
+    "llm_reusability", "container_color", "suggested_color", "timestamp_utc", "confidence"
+]
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def iter_record_chunks(db, collection_name, start=None, end=None, fields=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields lists of records (oldest first), each at most chunk_size long.
+
+    `start`/`end` are UTC ISO strings (end exclusive). Each chunk is a
+    separate query resuming after the last document of the previous one.
+    """
+    collection = db.collection(collection_name)
+    query = collection
+    if start:
+        query = query.where("timestamp_utc", ">=", start)
+    if end:
+        query = query.where("timestamp_utc", "<", end)
+    query = query.order_by("timestamp_utc").order_by(firestore.FieldPath.document_id())
+    if fields:
+        query = query.select(sorted(set(fields) | {"timestamp_utc"}))
+
+    last = None
+    while True:
+        page = query
+        if last:
+            page = page.start_after({"timestamp_utc": last[0], "__name__": collection.document(last[1])})
+        chunk = []
+        for snapshot in page.limit(chunk_size).stream():
+            rec = snapshot.to_dict()
+            last = (rec.get("timestamp_utc"), snapshot.id)
+            chunk.append({"id": snapshot.id, **rec})
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return "; ".join(str(v) for v in value)
+    return "" if value is None else value
+
+
+def csv_chunks(record_chunks, fields):
+    """Yields CSV text, a header followed by one block per record chunk."""
+    columns = ["id"] + list(fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for chunk in record_chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        for rec in chunk:
+            writer.writerow([csv_value(rec.get(c)) for c in columns])
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(record_chunks, fields):
+    """Yields Parquet file bytes, writing one row group per record chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"confidence": pa.float64(), "disposal_steps": pa.list_(pa.string())}
+    columns = ["id"] + list(fields)
+    schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for chunk in record_chunks:
+            table = pa.Table.from_pydict({c: [rec.get(c) for rec in chunk] for c in columns}, schema=schema)
+            writer.write_table(table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def parse_date(value, end=False, tz=timezone.utc):
+    """UTC ISO bound for a date/datetime string; values without an offset are in `tz`."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if end and len(value) == 10:
+        dt += timedelta(days=1)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz)
+    return dt.astimezone(timezone.utc).isoformat()
+
+
+def main():
+    from dotenv import load_dotenv
+    import firebase_admin
+    from firebase_admin import credentials
+    from time_buckets import get_timezone
+
+    parser = argparse.ArgumentParser(description="Export waste records to CSV or Parquet.")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--output", required=True, help="Output file path")
+    parser.add_argument("--start", help="Earliest date/datetime (inclusive)")
+    parser.add_argument("--end", help="Latest date/datetime (a bare date includes the whole day)")
+    parser.add_argument("--fields", help=f"Comma-separated columns (default: all of {','.join(EXPORT_FIELDS)})")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    fields = [f.strip() for f in args.fields.split(",") if f.strip()] if args.fields else EXPORT_FIELDS
+    unknown = [f for f in fields if f not in EXPORT_FIELDS]
+    if unknown:
+        parser.error(f"unknown fields: {', '.join(unknown)}")
+
+    load_dotenv()
+    tz = get_timezone(os.getenv("TIMEZONE", "UTC"))
+    try:
+        start = parse_date(args.start, tz=tz) if args.start else None
+        end = parse_date(args.end, end=True, tz=tz) if args.end else None
+    except (ValueError, OverflowError) as e:
+        parser.error(f"invalid date: {e}")
+
+    try:
+        cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+    except Exception as e:
+        print(f"❌ Firebase connection failed: {e}")
+        sys.exit(1)
+
+    record_chunks = iter_record_chunks(
+        db,
+        os.getenv("FIREBASE_COLLECTION", "waste_records"),
+        start,
+        end,
+        fields,
+        args.chunk_size
+    )
+    if args.format == "csv":
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            for text in csv_chunks(record_chunks, fields):
+                f.write(text)
+    else:
+        with open(args.output, "wb") as f:
+            for data in parquet_chunks(record_chunks, fields):
+                f.write(data)
+    print(f"✅ Exported records to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
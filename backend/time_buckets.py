@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Facility-local time bucket keys stored with each waste record.
+
+Every record is written with its local year, month, day and hour in the
+facility's TIMEZONE, so analytics can group on stored keys instead of parsing
+`timestamp_utc` on every request. Records written before the keys existed (or
+under a different TIMEZONE) can be updated with:
+
+    python time_buckets.py
+"""
+
+import os
+import sys
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+BUCKET_FIELDS = ["bucket_tz", "bucket_year", "bucket_month", "bucket_day", "bucket_hour"]
+
+
+def get_timezone(name):
+    """ZoneInfo for an IANA name like "Asia/Kolkata", or UTC if it is unknown."""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        print(f"⚠️ Unknown timezone {name!r}, using UTC.")
+        return timezone.utc
+
+
+def timezone_name(tz):
+    return getattr(tz, "key", "UTC")
+
+
+def time_bucket(dt, tz):
+    """Bucket keys for an aware datetime, in the given timezone."""
+    local = dt.astimezone(tz)
+    return {
+        "bucket_tz": timezone_name(tz),
+        "bucket_year": local.year,
+        "bucket_month": local.month,
+        "bucket_day": local.strftime("%Y-%m-%d"),
+        "bucket_hour": local.hour
+    }
+
+
+def record_bucket(rec, tz):
+    """Stored bucket keys of a record, recomputed from timestamp_utc if missing or for another timezone.
+
+    Returns None when the record has no usable timestamp.
+    """
+    if rec.get("bucket_tz") == timezone_name(tz) and all(rec.get(k) is not None for k in BUCKET_FIELDS):
+        return {k: rec[k] for k in BUCKET_FIELDS}
+    try:
+        dt = datetime.fromisoformat(rec["timestamp_utc"].replace("Z", "+00:00"))
+    except (KeyError, ValueError, AttributeError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return time_bucket(dt, tz)
+
+
+def main():
+    from dotenv import load_dotenv
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    from export_records import iter_record_chunks
+
+    load_dotenv()
+    tz = get_timezone(os.getenv("TIMEZONE", "UTC"))
+    try:
+        cred = credentials.Certificate(os.getenv("FIREBASE_CREDENTIALS_PATH"))
+        firebase_admin.initialize_app(cred)
+        db = firestore.client()
+    except Exception as e:
+        print(f"❌ Firebase connection failed: {e}")
+        sys.exit(1)
+
+    collection = db.collection(os.getenv("FIREBASE_COLLECTION", "waste_records"))
+    updated = 0
+    # Chunks of 500 match Firestore's limit on writes per batch
+    for chunk in iter_record_chunks(db, collection.id, fields=BUCKET_FIELDS, chunk_size=500):
+        batch = db.batch()
+        pending = 0
+        for rec in chunk:
+            bucket = record_bucket(rec, tz)
+            if bucket and any(rec.get(k) != v for k, v in bucket.items()):
+                batch.update(collection.document(rec["id"]), bucket)
+                pending += 1
+        if pending:
+            batch.commit()
+            updated += pending
+    print(f"✅ Time buckets ({timezone_name(tz)}) updated on {updated} records.")
+
+
+if __name__ == "__main__":
+    main()
@@ -116,7 +116,7 @@ const Home = () => {
 
       console.log('Sending request to /api/classify-medical-waste with container_color:', selectedColor);
       const response = await axios.post('http://localhost:8000/api/classify-medical-waste', formData, {
-        headers: { 'Content-Type': 'multipart/form-data' },
+        headers: { 'Content-Type': 'multipart/form-data', 'X-Request-Timeout': '60' },
         params: { container_color: selectedColor },
         timeout: 60000 // 60 seconds
       });